@@ -1,29 +1,56 @@
 import os
 import re
 import json
+import hashlib
 import arxiv
 import yaml
 import logging
+import asyncio
 import argparse
 import datetime
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Optional
 import time
+import random
+import threading
 import google.generativeai as genai
-import requests
+from google.api_core import exceptions as google_exceptions
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:  # pyyaml built without libyaml
+    from yaml import SafeLoader as YamlLoader
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib, same output just slower
+    orjson = None
+
 
+# quota errors carry the wait time, eg. "Please retry in 27.5s" or "retry_delay { seconds: 27 }"
+RETRY_HINT_RE = re.compile(r"retry in (\d+(?:\.\d+)?)s|retry_delay\s*\{\s*seconds:\s*(\d+)")
 
 # https://github.com/google-gemini/cookbook/tree/main
 # https://ai.google.dev/api?hl=zh-cn
 class Translater:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, concurrency: int = 5):
         self.api_key = api_key
+        # all requests run on one event loop in its own thread: the async grpc
+        # client is bound to that loop, and the topic threads share the
+        # `concurrency` request slots instead of translating one after another
+        self.concurrency = concurrency
+        self.sem = None
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
         genai.configure(api_key=self.api_key)  # 填入自己的api_key
 
-        # 查询模型
-        for m in genai.list_models():
-            print(m.name)
-            print(m.supported_generation_methods)
+        # 查询模型, costs an extra request so only on demand
+        if os.environ.get("GEMINI_DEBUG"):
+            for m in genai.list_models():
+                logging.info("%s %s", m.name, m.supported_generation_methods)
         sys_prompt = (
             "You are a highly skilled translator specializing in artificial intelligence and computer science. \
             You pride yourself on incredible accuracy and attention to detail. You always stick to the facts in the sources provided, and never make up new facts.\
@@ -38,8 +65,9 @@ class Translater:
             "
         )
 
+        self.model_name = "gemini-1.5-pro-latest"
         self.model = genai.GenerativeModel(
-            "gemini-1.5-pro-latest",
+            self.model_name,
             system_instruction=sys_prompt,
             generation_config=genai.GenerationConfig(
                 # max_output_tokens=2000,
@@ -52,11 +80,223 @@ class Translater:
     # 输出令牌限制:2048
     # 模型安全:自动应用的安全设置，可由开发者调整。如需了解详情，请参阅安全设置
 
-    def translate(self, text: str):
-        response = self.model.generate_content(
+    @staticmethod
+    def _retry_seconds(e: Exception, retry_count: int, cap: float = 60) -> float:
+        """
+        seconds to wait before the next attempt, the server hint wins if present
+        """
+        retry_after = getattr(e, "retry_after", None)
+        if retry_after is None and isinstance(e, google_exceptions.ResourceExhausted):
+            match = RETRY_HINT_RE.search(str(e))
+            if match:
+                retry_after = float(match.group(1) or match.group(2))
+        if retry_after is not None:
+            return float(retry_after)
+        # Here exponential backoff with full jitter is employed, so that concurrent requests
+        # don't retry in lockstep and hit the rate limit again all together.
+        return random.uniform(0, min(cap, 2**retry_count))
+
+    async def _generate_async(self, prompt: str, **kwargs) -> str:
+        retry_count = 0
+        NUM_RETRIES = 5
+        while True:
+            await asyncio.sleep(gemini_bucket.reserve())
+            try:
+                response = await self.model.generate_content_async(prompt, **kwargs)
+                gemini_bucket.on_success()
+                return response.text
+            except Exception as e:
+                if isinstance(e, google_exceptions.ResourceExhausted):
+                    gemini_bucket.on_fail()
+                retry_count += 1
+                if retry_count == NUM_RETRIES:
+                    logging.error("Could not recover after making %d attempts.", retry_count)
+                    raise
+                retry_seconds = self._retry_seconds(e, retry_count)
+                logging.warning("Received %s error, retry after %.1f seconds.", e, retry_seconds)
+                await asyncio.sleep(retry_seconds)
+
+    async def translate_async(self, text: str) -> str:
+        return await self._generate_async(
             f"Note output format, here is the abstract to translate:\n{text}"
         )
-        return response.text
+
+    async def _translate_batch_async(self, batch: List[str]) -> Optional[List[str]]:
+        prompt = (
+            "Note output format, translate each element of this JSON array of abstracts "
+            "and return a JSON array of strings of the same length and order:\n"
+            + json.dumps(batch, ensure_ascii=False)
+        )
+        text = await self._generate_async(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                temperature=0.8, response_mime_type="application/json"
+            ),
+        )
+        try:
+            result = json.loads(text)
+        except ValueError:
+            result = None
+        if not isinstance(result, list) or len(result) != len(batch):
+            # the model merged or dropped items, caller translates them one by one
+            return None
+        return [str(r) for r in result]
+
+    async def translate_many(self, texts: List[str], batch_size: int = 10) -> List[str]:
+        """
+        translate batches concurrently, at most `self.concurrency` requests in flight
+        across all callers
+        @param texts: list of english abstracts
+        @param batch_size: number of abstracts sent in one request
+        @return list of translations in the same order, source text where it failed
+        """
+        keys = [hashlib.sha1(text.encode()).hexdigest() for text in texts]
+        translations = [translation_cache.get(key) for key in keys]
+        todo = [i for i, translation in enumerate(translations) if translation is None]
+        if self.sem is None:
+            # created on the loop thread, shared by every translate_many call
+            self.sem = asyncio.Semaphore(self.concurrency)
+        sem = self.sem
+
+        async def limited(translate, arg):
+            async with sem:
+                return await translate(arg)
+
+        async def one(batch):
+            sources = [texts[i] for i in batch]
+            result = await limited(self._translate_batch_async, sources)
+            if result is None:
+                logging.warning(
+                    "batch translation returned a mismatched result, fall back to single requests"
+                )
+                result = await asyncio.gather(
+                    *[limited(self.translate_async, t) for t in sources],
+                    return_exceptions=True,
+                )
+            for i, translation in zip(batch, result):
+                if isinstance(translation, Exception):
+                    logging.error("translatation failed: %s", translation)
+                    continue
+                translations[i] = translation
+                translation_cache.set(keys[i], translation, model=self.model_name)
+
+        batches = [todo[i : i + batch_size] for i in range(0, len(todo), batch_size)]
+        results = await asyncio.gather(
+            *[one(batch) for batch in batches], return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error("translatation failed: %s", result)
+        # failed abstracts keep the source text and are not cached
+        return [
+            text if translation is None else translation
+            for text, translation in zip(texts, translations)
+        ]
+
+    def translate_batch(self, texts: List[str], batch_size: int = 10) -> List[str]:
+        """
+        blocking entry point of translate_many for the topic threads
+        @param texts: list of english abstracts
+        @param batch_size: number of abstracts sent in one request
+        @return list of translations in the same order
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.translate_many(texts, batch_size), self.loop
+        )
+        return future.result()
+
+
+class JsonCache:
+    """
+    persistent key-value cache stored in a json file, delete the file to bust it
+    """
+
+    def __init__(self, filename: str, ttl: float):
+        """
+        @param filename: str
+        @param ttl: seconds an entry stays valid
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = dict()
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                content = f.read()
+                if content:
+                    self.data = json.loads(content)
+
+    def get(self, key: str, default=None):
+        """
+        @return cached value, default if missing or expired
+        """
+        with self.lock:
+            entry = self.data.get(key)
+        if entry is None or time.time() - entry["ts"] > self.ttl:
+            return default
+        return entry["value"]
+
+    def set(self, key: str, value, **metadata):
+        with self.lock:
+            self.data[key] = {"value": value, "ts": time.time(), **metadata}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        now = time.time()
+        with self.lock:
+            # drop expired entries so the file does not grow forever
+            self.data = {
+                k: v for k, v in self.data.items() if now - v["ts"] <= self.ttl
+            }
+            tmp_filename = self.filename + ".tmp"
+            with open(tmp_filename, "w") as f:
+                json.dump(self.data, f)
+            os.replace(tmp_filename, self.filename)
+
+
+class AdaptiveTokenBucket:
+    """
+    client side rate limiter (Adaptive Token Bucket), the token rate grows on
+    success and shrinks on rate limit errors instead of only backing off
+    """
+
+    def __init__(self, sigma=0.5, delta=0.1, alpha=2, beta=0.5, cap=5):
+        """
+        @param sigma: initial and minimal rate, requests per second
+        @param delta: additive increase on success
+        @param alpha: multiplicative increase on success
+        @param beta: multiplicative decrease on failure
+        @param cap: maximal rate, requests per second
+        """
+        self.sigma = sigma
+        self.delta = delta
+        self.alpha = alpha
+        self.beta = beta
+        self.cap = cap
+        self.rate = sigma
+        self.tokens = 1.0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        take a token
+        @return seconds to wait until the token is available
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(1.0, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.cap, self.rate * self.alpha + self.delta)
+
+    def on_fail(self):
+        with self.lock:
+            self.rate = max(self.sigma, self.rate * self.beta)
 
 
 logging.basicConfig(
@@ -68,6 +308,65 @@ logging.basicConfig(
 base_url = "https://arxiv.paperswithcode.com/api/v0/papers/"
 github_url = "https://api.github.com/search/repositories"
 arxiv_url = "http://arxiv.org/"
+arxiv_abs_url = arxiv_url + "abs/"
+
+# markdown table row of one paper
+ROW_WITH_CODE = "|**%s**|[%s](%s)|**[link](%s)**|%s|\n"
+ROW_NO_CODE = "|**%s**|[%s](%s)|null|%s|\n"
+# row as stored by older versions, which kept rendered markdown in the json files
+ROW_RE = re.compile(
+    r"\|\*\*(.*?)\*\*\|\[(.*)\]\((\S*?)\)\|(?:null|\*\*\[link\]\((\S*?)\)\*\*)\|(.*?)\|*\n?",
+    re.S,
+)
+
+# inline latex in abstracts, eg. $O(n)$
+MATH_RE = re.compile(r"\$[^$]*\$")
+# arxiv version suffix, eg. 2108.09112v1
+VER_RE = re.compile(r"v\d+$")
+
+
+# arxiv.Client is not threadsafe, the topic threads take turns on the shared one
+arxiv_lock = threading.Lock()
+
+# keep-alive connection pool for paperswithcode/github, 429 and 5xx are
+# retried with backoff and the Retry-After header is honored
+session = requests.Session()
+adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+    ),
+)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+# remember results across runs: official code links hardly ever change,
+# translations never do and arxiv queries are rerun at most once a day
+cache_dir = "./cache"
+pwc_cache = JsonCache(os.path.join(cache_dir, "pwc_cache.json"), ttl=7 * 24 * 3600)
+translation_cache = JsonCache(
+    os.path.join(cache_dir, "translations.json"), ttl=30 * 24 * 3600
+)
+arxiv_cache = JsonCache(os.path.join(cache_dir, "arxiv_cache.json"), ttl=24 * 3600)
+
+# one limiter per process, shared by all translaters and threads
+gemini_bucket = AdaptiveTokenBucket()
+
+
+def json_loads(content: bytes):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def json_dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode()
 
 
 def load_config(config_file: str) -> dict:
@@ -100,9 +399,9 @@ def load_config(config_file: str) -> dict:
         return keywords
 
     with open(config_file, "r") as f:
-        config = yaml.load(f, Loader=yaml.FullLoader)
+        config = yaml.load(f, Loader=YamlLoader)
         config["kv"] = pretty_filters(**config)
-        logging.info(f"config = {config}")
+        logging.info("config = %s", config)
 
     return config
 
@@ -117,12 +416,11 @@ def get_authors(authors, first_author=False):
 
 
 def sort_papers(papers):
-    output = dict()
-    keys = list(papers.keys())
-    keys.sort(reverse=True)
-    for key in keys:
-        output[key] = papers[key]
-    return output
+    """
+    newest paper first, the archive is kept in this order so rendering needn't sort
+    """
+    # the stored papers are already sorted, timsort makes this nearly linear
+    return dict(sorted(papers.items(), reverse=True))
 
 
 def get_code_link(qword: str) -> str:
@@ -135,7 +433,7 @@ def get_code_link(qword: str) -> str:
     # query = f"arxiv:{arxiv_id}"
     query = f"{qword}"
     params = {"q": query, "sort": "stars", "order": "desc"}
-    r = requests.get(github_url, params=params)
+    r = session.get(github_url, params=params, timeout=10)
     results = r.json()
     code_link = None
     if results["total_count"] > 0:
@@ -143,212 +441,211 @@ def get_code_link(qword: str) -> str:
     return code_link
 
 
+def get_repo_url(paper_id: str) -> Optional[str]:
+    """
+    @param paper_id: arxiv id, eg. 2108.09112 or 2108.09112v1
+    @return official code url from paperswithcode: string, if not found, return None
+    """
+    # daily and weekly runs share one cache key per paper
+    paper_id = VER_RE.sub("", paper_id)
+    repo_url = pwc_cache.get(paper_id)
+    if repo_url is not None:
+        return repo_url
+    try:
+        r = session.get(base_url + paper_id, timeout=10).json()
+        if isinstance(r, dict) and r.get("official"):
+            repo_url = r["official"].get("url")
+    except Exception as e:
+        logging.error("exception: %s with id: %s", e, paper_id)
+        return None
+    if repo_url is not None:
+        # only found links are cached, papers without code are asked again next run
+        pwc_cache.set(paper_id, repo_url)
+    return repo_url
+
+
 def get_daily_papers(
-    topic, query="slam", max_results=2, translater: Optional[Translater] = None
+    topic,
+    client: arxiv.Client,
+    query="slam",
+    max_results=2,
+    translater: Optional[Translater] = None,
 ):
     """
     @param topic: str
+    @param client: arxiv client shared by all topics
     @param query: str
     @return paper_with_code: dict
     """
     # output
     content = dict()
-    content_to_web = dict()
-    print(f"query = {query}")
+    logging.debug("query = %s", query)
     search_engine = arxiv.Search(
         query=query, max_results=max_results, sort_by=arxiv.SortCriterion.SubmittedDate
     )
 
-    for result in search_engine.results():
-        paper_id = result.get_short_id()
-        paper_title = result.title
-        paper_url = result.entry_id
-        code_url = base_url + paper_id  # TODO
-        paper_abstract = result.summary.replace("\n", " ")
-        paper_authors = get_authors(result.authors)
-        paper_first_author = get_authors(result.authors, first_author=True)
-        primary_category = result.primary_category
-        publish_time = result.published.date()
-        update_time = result.updated.date()
-        comments = result.comment
-
-        if translater:
-            print(f"Translating {paper_title}")
-            retry_count = 0
-            retry_seconds = 60
-            NUM_RETRIES = 3
-            while retry_count < NUM_RETRIES:
-                try:
-                    paper_abstract = translater.translate(paper_abstract)
-                    break
-                except Exception as e:
-                    print(f"Received {e} error, retry after {retry_seconds} seconds.")
-                    time.sleep(retry_seconds)
-                    retry_count += 1
-                    # Here exponential backoff is employed to ensure the account doesn't get rate limited by making
-                    # too many requests too quickly. This increases the time to wait between requests by a factor of 2.
-                    retry_seconds *= 2
-                finally:
-                    if retry_count == NUM_RETRIES:
-                        print(
-                            "Could not recover after making " f"{retry_count} attempts."
-                        )
-                        print(f"translatation failed. paper_abstract:\n {paper_abstract} ")
-
-        logging.info(f"Time = {update_time} title = {paper_title}")
-        paper_abstract = paper_abstract.rstrip() #删除末尾的指定字符，默认为空白符，包括空格、换行符、回车符、制表符。
-        # eg: 2108.09112v1 -> 2108.09112
-        ver_pos = paper_id.find("v")
-        if ver_pos == -1:
-            paper_key = paper_id
-        else:
-            paper_key = paper_id[0:ver_pos]
-        paper_url = arxiv_url + "abs/" + paper_key
+    # a rerun on the same day reuses the list, the next day always queries again
+    cache_key = f"{datetime.date.today()}|{max_results}|{query}"
+    papers = arxiv_cache.get(cache_key)
+    if papers is None:
+        # arxiv.Client is not threadsafe, fetch the whole page under the lock
+        with arxiv_lock:
+            results = list(client.results(search_engine))
+
+        papers = []
+        for result in results:
+            paper_id = result.get_short_id()
+            paper_title = result.title
+            paper_abstract = result.summary.replace("\n", " ")
+            update_time = result.updated.date()
+            papers.append(
+                {
+                    "id": paper_id,
+                    "title": paper_title,
+                    "abstract": paper_abstract,
+                    "update_time": str(update_time),
+                }
+            )
+        arxiv_cache.set(cache_key, papers)
+    # the records are translated in place, keep the cached ones untouched
+    papers = [dict(paper) for paper in papers]
 
+    if translater and papers:
+        logging.info("Translating %d abstracts of %s", len(papers), topic)
+        abstracts = [paper["abstract"] for paper in papers]
         try:
-            # source code link
-            r = requests.get(code_url).json()
-            repo_url = None
-            if "official" in r and r["official"]:
-                repo_url = r["official"]["url"]
-            # TODO: not found, two more chances
-            # else:
-            #    repo_url = get_code_link(paper_title)
-            #    if repo_url is None:
-            #        repo_url = get_code_link(paper_key)
-            if repo_url is not None:
-                content[paper_key] = "|**{}**|[{}]({})|**[link]({})**|{}|\n".format(
-                    update_time,
-                    paper_title,
-                    paper_url,
-                    repo_url,
-                    paper_abstract,
-                )
-                content_to_web[paper_key] = (
-                    "- {}, Paper: [{}]({}), Code: **[{}]({})**,Abstract: {}".format(
-                        update_time,
-                        paper_title,
-                        paper_url,
-                        repo_url,
-                        repo_url,
-                        paper_abstract,
-                    )
-                )
+            abstracts = translater.translate_batch(abstracts)
+        except Exception as e:
+            logging.error("translatation failed. topic: %s, error: %s", topic, e)
+        for paper, paper_abstract in zip(papers, abstracts):
+            paper["abstract"] = paper_abstract
 
-            else:
-                content[paper_key] = "|**{}**|[{}]({})|null|{}|\n".format(
-                    update_time, paper_title, paper_url, paper_abstract
-                )
-                content_to_web[paper_key] = "- {}, Paper: [{}]({}),{}".format(
-                    update_time, paper_title, paper_url, paper_abstract
-                )
+    # paperswithcode lookups are I/O-bound, overlap them
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        repo_urls = list(executor.map(get_repo_url, [paper["id"] for paper in papers]))
 
-            # TODO: select useful comments
-            comments = None
-            if comments != None:
-                content_to_web[paper_key] += f", {comments}\n"
-            else:
-                content_to_web[paper_key] += f"\n"
+    for paper, repo_url in zip(papers, repo_urls):
+        paper_id = paper["id"]
+        paper_title = paper["title"]
+        paper_abstract = paper["abstract"]
+        update_time = paper["update_time"]
 
-        except Exception as e:
-            logging.error(f"exception: {e} with id: {paper_key}")
+        logging.info("Time = %s title = %s", update_time, paper_title)
+        paper_abstract = paper_abstract.rstrip() #删除末尾的指定字符，默认为空白符，包括空格、换行符、回车符、制表符。
+        # eg: 2108.09112v1 -> 2108.09112
+        paper_key = VER_RE.sub("", paper_id)
+        paper_url = arxiv_abs_url + paper_key
+
+        # TODO: not found, two more chances
+        # if repo_url is None:
+        #    repo_url = get_code_link(paper_title)
+        #    if repo_url is None:
+        #        repo_url = get_code_link(paper_key)
+        # rendered to markdown by json_to_md
+        content[paper_key] = {
+            "update_time": update_time,
+            "title": paper_title,
+            "url": paper_url,
+            "repo_url": repo_url,
+            "abstract": paper_abstract,
+        }
 
     data = {topic: content}
-    data_web = {topic: content_to_web}
-    return data, data_web
+    return data
 
 
-def update_paper_links(filename):
+def parse_paper_row(paper_id: str, row: str) -> dict:
     """
-    weekly update paper links in json file
+    @param paper_id: arxiv id the row is stored under
+    @param row: markdown table row stored by older versions
+    @return paper record as stored by get_daily_papers
     """
+    match = ROW_RE.fullmatch(row)
+    if match is None:
+        raise ValueError(f"cannot parse stored row of paper {paper_id}: {row!r}")
+    update_time, title, url, repo_url, abstract = match.groups()
+    return {
+        "update_time": update_time,
+        "title": title,
+        "url": url,
+        "repo_url": repo_url,
+        "abstract": abstract,
+    }
 
-    def parse_arxiv_string(s):
-        parts = s.split("|")
-        date = parts[1].strip()
-        title = parts[2].strip()
-        paper_url = parts[3].strip()
-        code = parts[4].strip()
-        abstract = parts[5].strip()
-        paper_url = re.sub(r"v\d+", "", paper_url)
-        return date, title, paper_url, code, abstract
-
-    with open(filename, "r") as f:
-        content = f.read()
-        if not content:
-            m = {}
-        else:
-            m = json.loads(content)
 
-        json_data = m.copy()
+def format_paper(paper: dict) -> str:
+    """
+    @param paper: paper record as stored by get_daily_papers
+    @return markdown table row
+    """
+    if paper["repo_url"] is not None:
+        return ROW_WITH_CODE % (
+            paper["update_time"],
+            paper["title"],
+            paper["url"],
+            paper["repo_url"],
+            paper["abstract"],
+        )
+    return ROW_NO_CODE % (
+        paper["update_time"], paper["title"], paper["url"], paper["abstract"]
+    )
+
 
-        for keywords, v in json_data.items():
-            logging.info(f"keywords = {keywords}")
-            for paper_id, contents in v.items():
-                contents = str(contents)
+def load_json(filename) -> dict:
+    with open(filename, "rb") as f:
+        content = f.read()
+    if not content:
+        return {}
+    json_data = json_loads(content)
+    # convert archives written as markdown rows
+    for papers in json_data.values():
+        for paper_id, paper in papers.items():
+            if isinstance(paper, str):
+                papers[paper_id] = parse_paper_row(paper_id, paper)
+    return json_data
 
-                (
-                    update_time,
-                    paper_title,
-                    paper_url,
-                    code_url,
-                    abstract,
-                ) = parse_arxiv_string(contents)
 
-                contents = "|{}|{}|{}|{}|{}|\n".format(
-                    update_time, paper_title, paper_url, code_url, abstract
-                )
-                json_data[keywords][paper_id] = str(contents)
-                logging.info(f"paper_id = {paper_id}, contents = {contents}")
+def save_json(filename, json_data: dict):
+    with open(filename, "wb") as f:
+        f.write(json_dumps(json_data))
 
-                valid_link = False if "|null|" in contents else True
-                if valid_link:
-                    continue
-                try:
-                    code_url = base_url + paper_id  # TODO
-                    r = requests.get(code_url).json()
-                    repo_url = None
-                    if "official" in r and r["official"]:
-                        repo_url = r["official"]["url"]
-                        if repo_url is not None:
-                            new_cont = contents.replace(
-                                "|null|", f"|**[link]({repo_url})**|"
-                            )
-                            logging.info(f"ID = {paper_id}, contents = {new_cont}")
-                            json_data[keywords][paper_id] = str(new_cont)
-
-                except Exception as e:
-                    logging.error(f"exception: {e} with id: {paper_id}")
-        # dump to json file
-        with open(filename, "w") as f:
-            json.dump(json_data, f)
-
-
-def update_json_file(filename, data_dict):
+
+def update_paper_links(json_data: dict):
     """
-    daily update json file using data_dict
+    weekly update paper links in json data, in place
     """
-    with open(filename, "r") as f:
-        content = f.read()
-        if not content:
-            m = {}
-        else:
-            m = json.loads(content)
+    missing = []
+    for keywords, v in json_data.items():
+        logging.info("keywords = %s", keywords)
+        for paper_id, paper in v.items():
+            logging.debug("paper_id = %s, paper = %s", paper_id, paper)
+            if paper["repo_url"] is None:
+                missing.append((paper_id, paper))
+
+    # paperswithcode lookups are I/O-bound, overlap them
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        repo_urls = executor.map(get_repo_url, [paper_id for paper_id, _ in missing])
+
+        for (paper_id, paper), repo_url in zip(missing, repo_urls):
+            if repo_url is not None:
+                paper["repo_url"] = repo_url
+                logging.info("ID = %s, code = %s", paper_id, repo_url)
 
-    json_data = m.copy()
+    for keywords, v in json_data.items():
+        json_data[keywords] = sort_papers(v)
 
+
+def update_json_data(json_data: dict, data_dict):
+    """
+    daily update json data using data_dict, in place
+    """
     # update papers in each keywords
     for data in data_dict:
-        for keyword in data.keys():
-            papers = data[keyword]
-
-            if keyword in json_data.keys():
-                json_data[keyword].update(papers)
-            else:
-                json_data[keyword] = papers
+        for keyword, papers in data.items():
+            json_data.setdefault(keyword, {}).update(papers)
 
-    with open(filename, "w") as f:
-        json.dump(json_data, f)
+    for keyword, papers in json_data.items():
+        json_data[keyword] = sort_papers(papers)
 
 
 def json_to_md(
@@ -359,116 +656,107 @@ def json_to_md(
     use_title=True,
     use_tc=True,
     use_b2t=True,
+    data: Optional[dict] = None,
 ):
     """
     @param filename: str
     @param md_filename: str
+    @param data: json data already loaded from filename, read from filename if None
     @return None
     """
 
     def pretty_math(s: str) -> str:
-        ret = ""
-        match = re.search(r"\$.*\$", s)
-        if match == None:
-            return s
-        math_start, math_end = match.span()
-        space_trail = space_leading = ""
-        if s[:math_start][-1] != " " and "*" != s[:math_start][-1]:
-            space_trail = " "
-        if s[math_end:][0] != " " and "*" != s[math_end:][0]:
-            space_leading = " "
-        ret += s[:math_start]
-        ret += f"{space_trail}${match.group()[1:-1].strip()}${space_leading}"
-        ret += s[math_end:]
-        return ret
+        def pad_math(match) -> str:
+            math_start, math_end = match.span()
+            space_trail = space_leading = ""
+            if math_start > 0 and s[math_start - 1] not in " *":
+                space_trail = " "
+            if math_end < len(s) and s[math_end] not in " *":
+                space_leading = " "
+            return f"{space_trail}${match.group()[1:-1].strip()}${space_leading}"
+
+        return MATH_RE.sub(pad_math, s)
 
     DateNow = datetime.date.today()
     DateNow = str(DateNow)
     DateNow = DateNow.replace("-", ".")
 
-    with open(filename, "r") as f:
-        content = f.read()
-        if not content:
-            data = {}
-        else:
-            data = json.loads(content)
+    if data is None:
+        data = load_json(filename)
 
-    # clean README.md if daily already exist else create it
-    with open(md_filename, "w+") as f:
-        pass
+    # collect the markdown and write it with a single call
+    parts = []
+    if (use_title == True) and (to_web == True):
+        parts.append("---\n" + "layout: default\n" + "---\n\n")
 
-    # write data into README.md
-    with open(md_filename, "a+") as f:
-        if (use_title == True) and (to_web == True):
-            f.write("---\n" + "layout: default\n" + "---\n\n")
+    if use_title == True:
+        # parts.append(("<p align="center"><h1 align="center"><br><ins>AI-ARXIV-DAILY"
+        #         "</ins><br>Automatically Update AI Papers Daily</h1></p>\n"))
+        parts.append("## Updated on " + DateNow + "\n")
+    else:
+        parts.append("> Updated on " + DateNow + "\n")
 
-        if use_title == True:
-            # f.write(("<p align="center"><h1 align="center"><br><ins>AI-ARXIV-DAILY"
-            #         "</ins><br>Automatically Update AI Papers Daily</h1></p>\n"))
-            f.write("## Updated on " + DateNow + "\n")
-        else:
-            f.write("> Updated on " + DateNow + "\n")
-
-        # TODO: add usage
-        f.write("> Usage instructions: [here](./docs/README.md#usage)\n\n")
-
-        # Add: table of contents
-        if use_tc == True:
-            f.write("<details>\n")
-            f.write("  <summary>Table of Contents</summary>\n")
-            f.write("  <ol>\n")
-            for keyword in data.keys():
-                day_content = data[keyword]
-                if not day_content:
-                    continue
-                kw = keyword.replace(" ", "-")
-                f.write(f"    <li><a href=#{kw.lower()}>{keyword}</a></li>\n")
-            f.write("  </ol>\n")
-            f.write("</details>\n\n")
+    # TODO: add usage
+    parts.append("> Usage instructions: [here](./docs/README.md#usage)\n\n")
 
+    # Add: table of contents
+    if use_tc == True:
+        parts.append("<details>\n")
+        parts.append("  <summary>Table of Contents</summary>\n")
+        parts.append("  <ol>\n")
         for keyword in data.keys():
             day_content = data[keyword]
             if not day_content:
                 continue
-            # the head of each part
-            f.write(f"## {keyword}\n\n")
-
-            if use_title == True:
-                if to_web == False:
-                    f.write(
-                        "|Publish Date|Title|Code|Abstract|\n"
-                        + "|---|---|---|--------------------------------------------------|\n"
-                    )
-                else:
-                    f.write("| Publish Date | Title | Code | Abstract |\n")
-                    f.write(
-                        "|:---------|:-----------------------|:------|:-------------------------------------------------|\n"
-                    )
-
-            # sort papers by date
-            day_content = sort_papers(day_content)
-
-            for _, v in day_content.items():
-                if v is not None:
-                    f.write(pretty_math(v))  # make latex pretty
-
-            f.write(f"\n")
-
-            # Add: back to top
-            if use_b2t:
-                top_info = f"#Updated on {DateNow}"
-                top_info = top_info.replace(" ", "-").replace(".", "")
-                f.write(
-                    f"<p align=right>(<a href={top_info.lower()}>back to top</a>)</p>\n\n"
+            kw = keyword.replace(" ", "-")
+            parts.append(f"    <li><a href=#{kw.lower()}>{keyword}</a></li>\n")
+        parts.append("  </ol>\n")
+        parts.append("</details>\n\n")
+
+    for keyword in data.keys():
+        day_content = data[keyword]
+        if not day_content:
+            continue
+        # the head of each part
+        parts.append(f"## {keyword}\n\n")
+
+        if use_title == True:
+            if to_web == False:
+                parts.append(
+                    "|Publish Date|Title|Code|Abstract|\n"
+                    + "|---|---|---|--------------------------------------------------|\n"
                 )
+            else:
+                parts.append("| Publish Date | Title | Code | Abstract |\n")
+                parts.append(
+                    "|:---------|:-----------------------|:------|:-------------------------------------------------|\n"
+                )
+
+        # papers are stored newest first by update_json_data/update_paper_links
+        for _, v in day_content.items():
+            if v is not None:
+                parts.append(pretty_math(format_paper(v)))  # make latex pretty
+
+        parts.append(f"\n")
+
+        # Add: back to top
+        if use_b2t:
+            top_info = f"#Updated on {DateNow}"
+            top_info = top_info.replace(" ", "-").replace(".", "")
+            parts.append(
+                f"<p align=right>(<a href={top_info.lower()}>back to top</a>)</p>\n\n"
+            )
 
-    logging.info(f"{task} finished")
+    # overwrite README.md if daily already exist else create it
+    with open(md_filename, "w", buffering=1 << 20) as f:
+        f.writelines(parts)
+
+    logging.info("%s finished", task)
 
 
 def demo(translater: Optional[Translater] = None, **config):
     # TODO: use config
     data_collector = []
-    data_collector_web = []
 
     keywords = config["kv"]
     max_results = config["max_results"]
@@ -476,41 +764,55 @@ def demo(translater: Optional[Translater] = None, **config):
     publish_gitpage = config["publish_gitpage"]
 
     b_update = config["update_paper_links"]
-    logging.info(f"Update Paper Link = {b_update}")
+    logging.info("Update Paper Link = %s", b_update)
     if config["update_paper_links"] == False:
-        logging.info(f"GET daily papers begin")
-        for topic, keyword in keywords.items():
-            logging.info(f"topic: {topic}, keyword: {keyword}")
-            data, data_web = get_daily_papers(
-                topic, query=keyword, max_results=max_results, translater=translater
-            )
-            data_collector.append(data)
-            data_collector_web.append(data_web)
-            print("\n")
-        logging.info(f"GET daily papers end")
+        logging.info("GET daily papers begin")
+        # one client for all topics, arxiv asks for one request every 3 seconds;
+        # a topic is exactly one page so no inter-page delay within a topic
+        client = arxiv.Client(page_size=max_results, delay_seconds=3, num_retries=3)
+        # topics are independent and I/O-bound, fetch them concurrently
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = {
+                executor.submit(
+                    get_daily_papers, topic, client, keyword, max_results, translater
+                ): topic
+                for topic, keyword in keywords.items()
+            }
+            # keep the keyword order of the config in the output files
+            for future, topic in futures.items():
+                logging.info("topic: %s, keyword: %s", topic, keywords[topic])
+                data_collector.append(future.result())
+        logging.info("GET daily papers end")
+
+    # readme and gitpage archives hold the same papers, parse and update them
+    # only once, the markdown is rendered from the same in-memory data
+    json_files = []
+    if publish_readme:
+        json_files.append(config["json_readme_path"])
+    if publish_gitpage:
+        json_files.append(config["json_gitpage_path"])
+    if json_files:
+        json_data = load_json(json_files[0])
+        if config["update_paper_links"]:
+            # update paper links
+            update_paper_links(json_data)
+        else:
+            # update json data
+            update_json_data(json_data, data_collector)
+        for json_file in json_files:
+            save_json(json_file, json_data)
 
     # 1. update README.md file
     if publish_readme:
         json_file = config["json_readme_path"]
         md_file = config["md_readme_path"]
-        # update paper links
-        if config["update_paper_links"]:
-            update_paper_links(json_file)
-        else:
-            # update json data
-            update_json_file(json_file, data_collector)
         # json data to markdown
-        json_to_md(json_file, md_file, task="Update Readme")
+        json_to_md(json_file, md_file, task="Update Readme", data=json_data)
 
     # 2. update docs/index.md file (to gitpage)
     if publish_gitpage:
         json_file = config["json_gitpage_path"]
         md_file = config["md_gitpage_path"]
-        # TODO: duplicated update paper links!!!
-        if config["update_paper_links"]:
-            update_paper_links(json_file)
-        else:
-            update_json_file(json_file, data_collector)
         json_to_md(
             json_file,
             md_file,
@@ -518,8 +820,13 @@ def demo(translater: Optional[Translater] = None, **config):
             to_web=True,
             use_tc=False,
             use_b2t=False,
+            data=json_data,
         )
 
+    pwc_cache.save()
+    translation_cache.save()
+    arxiv_cache.save()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()